@@ -0,0 +1,21 @@
+# Gunicorn configuration for Nexufy
+# Run with: gunicorn -c gunicorn.conf.py main:app
+import os
+
+# Railway provides PORT environment variable
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# One process per usable core, capped at 4: each worker carries its own spotdl client, download
+# pools and caches. Each serves requests on a pool of threads so requests waiting on I/O
+# (cookie probes, conversions, file transfers) don't pin a whole process.
+# Flask is a WSGI app, so threaded sync workers are used rather than an ASGI worker class.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(len(os.sched_getaffinity(0)), 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Downloads run as background jobs, but conversions and large transfers still take a while
+timeout = 600
+keepalive = 5
+
+# Load the app once in the master so the scheduler and warmed caches are shared
+preload_app = True
@@ -1,26 +1,67 @@
 import os
-import uuid
+import secrets
 import shutil
-import glob
+import functools
+import hashlib
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, send_from_directory, flash, redirect, url_for
+from flask import Flask, Request, render_template, request, send_from_directory, flash, redirect, url_for, jsonify
 from spotdl import Spotdl, AudioProviderError
 from spotdl.download.downloader import Downloader
 from spotdl.types.song import Song
 from apscheduler.schedulers.background import BackgroundScheduler
 from pydub import AudioSegment
+import json
 import logging
+import logging.handlers
+import queue
 import re
+import shlex
+import http.cookiejar
+import string
+import time
 import tempfile
+import subprocess
+import zipfile
 import requests
+import urllib.parse
+import werkzeug.utils
 
 # --- Configuration ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Log records are handed to a background listener so request and download threads never block on stderr
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                    handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)
+
+def restart_log_listener_in_child():
+    """Discard records the parent still owns, then give the forked child its own listener thread"""
+    while True:
+        try:
+            log_queue.get_nowait()
+        except queue.Empty:
+            break
+    log_listener.start()
+
+# Threads do not survive fork: drain before gunicorn --preload forks a worker, then restart on both sides
+os.register_at_fork(before=log_listener.stop, after_in_parent=log_listener.start, after_in_child=restart_log_listener_in_child)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'a_secure_random_secret_key')
+app.config['TEMPLATES_AUTO_RELOAD'] = False  # Templates ship with the image; skip the per-render mtime check
 
 # --- Railway-specific ffmpeg configuration ---
+@functools.lru_cache(maxsize=1)
 def find_ffmpeg():
+    override = os.environ.get('FFMPEG_BIN')
+    if override:
+        logging.info(f"Using ffmpeg from FFMPEG_BIN: {override}")
+        return override
+
     possible_paths = [
         "/usr/bin/ffmpeg",
         "/usr/local/bin/ffmpeg",
@@ -36,7 +77,13 @@ def find_ffmpeg():
     logging.warning("ffmpeg not found, pydub may not work properly")
     return "ffmpeg"  # Fallback to system PATH
 
+@functools.lru_cache(maxsize=1)
 def find_ffprobe():
+    override = os.environ.get('FFPROBE_BIN')
+    if override:
+        logging.info(f"Using ffprobe from FFPROBE_BIN: {override}")
+        return override
+
     possible_paths = [
         "/usr/bin/ffprobe",
         "/usr/local/bin/ffprobe",
@@ -53,8 +100,12 @@ def find_ffprobe():
     return "ffprobe"  # Fallback to system PATH
 
 # Set ffmpeg paths dynamically for Railway
-AudioSegment.converter = find_ffmpeg()
-AudioSegment.ffprobe = find_ffprobe()
+FFMPEG = find_ffmpeg()
+FFPROBE = find_ffprobe()
+AudioSegment.converter = FFMPEG
+AudioSegment.ffprobe = FFPROBE
+# Never read the terminal (a backgrounded worker would be stopped by SIGTTIN) and only log real errors
+FFMPEG_QUIET_ARGS = ["-nostdin", "-hide_banner", "-loglevel", "error"]
 
 # --- Railway-optimized folder setup with temp directory ---
 TEMP_BASE = os.environ.get('RAILWAY_VOLUME_MOUNT_PATH', '/tmp')
@@ -62,80 +113,185 @@ DOWNLOAD_FOLDER = os.path.join(TEMP_BASE, 'downloads')
 CONVERTER_UPLOADS = os.path.join(TEMP_BASE, 'converter_uploads')
 CONVERTER_OUTPUT = os.path.join(TEMP_BASE, 'converter_output')
 COOKIES_FOLDER = os.path.join(TEMP_BASE, 'cookies')  # New folder for user cookies
-
-for folder in [DOWNLOAD_FOLDER, CONVERTER_UPLOADS, CONVERTER_OUTPUT, COOKIES_FOLDER]:
-    if not os.path.exists(folder):
-        os.makedirs(folder, exist_ok=True)
-        logging.info(f"Created directory: {folder}")
+# nginx `internal` location aliased to TEMP_BASE, e.g. /protected; when set, nginx serves downloads via X-Accel-Redirect
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+JOBS_FOLDER = os.path.join(TEMP_BASE, 'jobs')  # Download job status files, shared by all workers
+
+# Service configuration, read once at startup
+SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
+SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
+PROXY_URL = os.environ.get('PROXY_URL')
+if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
+    logging.warning("SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET are not set; downloads will fail until they are configured")
+
+# Songs are downloaded in parallel on one pool shared by all jobs in this worker, which also caps
+# how many are in flight at once; keep this modest to avoid YouTube throttling
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', '5'))
+song_downloads = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='song-download')
+
+# Downloads run in the background so the request worker is released as soon as the job is queued
+DOWNLOAD_JOB_WORKERS = int(os.environ.get('DOWNLOAD_JOB_WORKERS', '2'))
+download_jobs = ThreadPoolExecutor(max_workers=DOWNLOAD_JOB_WORKERS, thread_name_prefix='download-job')
+# Each song thread keeps its proxy and direct Downloaders, plus room for a cookies switch mid-job
+thread_downloaders = threading.local()
+DOWNLOADERS_PER_THREAD = 4
+job_status_lock = threading.Lock()
+# A running job whose status hasn't been written for this long lost its worker (restart, deploy, OOM kill);
+# queued jobs can legitimately wait longer than that, so they are checked against their worker process instead
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', '1800'))
+
+# The archive listing is cached and rebuilt when the downloads folder changes or the TTL expires
+DOWNLOADS_CACHE_TTL = int(os.environ.get('DOWNLOADS_CACHE_TTL', '30'))
+downloads_cache = {'key': None, 'expires': 0, 'data': [], 'page': None}
+downloads_cache_lock = threading.Lock()
+
+# Cookie probe results are reused until the file changes or the TTL expires, instead of hitting YouTube every time
+COOKIES_TEST_TTL = int(os.environ.get('COOKIES_TEST_TTL', '300'))
+cookies_test_cache = {}  # path -> ((mtime_ns, size), expires, (is_working, status))
+cookies_test_cache_lock = threading.Lock()
+# The uploaded cookies listing only changes when a file is added or removed, which bumps the folder's mtime
+cookie_files_cache = {'key': None, 'files': []}
+cookie_files_cache_lock = threading.Lock()
+
+for folder in [DOWNLOAD_FOLDER, CONVERTER_UPLOADS, CONVERTER_OUTPUT, COOKIES_FOLDER, JOBS_FOLDER]:
+    os.makedirs(folder, exist_ok=True)
+
+class SpooledUploadRequest(Request):
+    """Request that spools uploads to named files in CONVERTER_UPLOADS, so ffmpeg can read them in place"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Removed automatically when Flask closes the request's files
+        return tempfile.NamedTemporaryFile('wb+', dir=CONVERTER_UPLOADS, suffix='.upload')
+
+app.request_class = SpooledUploadRequest
 
 # --- Helper Functions ---
+SAFE_NAME_CHARS = frozenset((string.ascii_letters + string.digits + '_-').encode('ascii'))
+UNSAFE_NAME_BYTES = bytes(c for c in range(128) if c not in SAFE_NAME_CHARS)
+# Netscape cookie lines: 7+ tab-separated fields; '#' lines (including #HttpOnly_ entries) and blank lines are skipped
+COOKIE_LINE_DOMAIN = re.compile(rb'^(?!#)(?![ \t\r\f\v]*$)([^\t\n]*)(?:\t[^\t\n]*){6}', re.M)
+INVALID_COOKIE_LINE = re.compile(rb'^(?!#)(?![ \t\r\f\v]*$)(?!(?:[^\t\n]*\t){6})[^\n]*', re.M)
+# Anything but letters, digits, spaces and dashes (Unicode-aware, like str.isalnum)
+PLAYLIST_NAME_UNSAFE = re.compile(r'[^\w -]|_')
+
+SANITIZE_CACHE_MAX_INPUT = 256  # Longer inputs are sanitized uncached, so the cache can't pin huge form values
+
 def sanitize_name(name):
+    if name and len(name) > SANITIZE_CACHE_MAX_INPUT:
+        return _sanitize_name(name)
+    return _cached_sanitize_name(name)
+
+def _sanitize_name(name):
     if not name:
         return "guest"
-    return re.sub(r'[^a-zA-Z0-9_-]', '', name).strip()[:50] or "guest"
+    # Drop non-ASCII, then delete every unsafe ASCII byte in one C-level pass
+    return name.encode('ascii', 'ignore').translate(None, UNSAFE_NAME_BYTES).decode('ascii')[:50] or "guest"
+
+_cached_sanitize_name = functools.lru_cache(maxsize=256)(_sanitize_name)
+
+def write_file_atomic(path, data):
+    """Write bytes through a temporary file in the same folder, so readers never see a partial file"""
+    with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+        tmp_path = f.name
+        try:
+            f.write(data)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+MAX_COOKIES_FILE_SIZE = 1 << 20  # Real cookie exports are a few KB
+MAX_COOKIES_UPLOAD_SIZE = MAX_COOKIES_FILE_SIZE + (64 << 10)  # Room for the multipart framing and form fields
 
 def validate_cookies_file(content):
-    """Validate that uploaded content is a proper cookies file"""
-    lines = content.strip().split('\n')
+    """Validate that uploaded content (bytes) is a proper cookies file"""
+    content = content.strip()
 
     # Check for Netscape header
-    if not lines[0].startswith('# Netscape HTTP Cookie File'):
+    if not content.startswith(b'# Netscape HTTP Cookie File'):
         return False, "Invalid format: Missing Netscape header"
 
-    # Check for YouTube/Google cookies
-    has_youtube_cookies = False
-    valid_lines = 0
-
-    for line in lines[1:]:  # Skip header
-        if line.startswith('#') or not line.strip():
-            continue
-
-        parts = line.split('\t')
-        if len(parts) >= 7:
-            domain = parts[0]
-            if 'youtube.com' in domain or 'google.com' in domain:
-                has_youtube_cookies = True
-            valid_lines += 1
-        else:
-            return False, f"Invalid line format: {line[:50]}..."
+    bad_line = INVALID_COOKIE_LINE.search(content)
+    if bad_line:
+        return False, f"Invalid line format: {bad_line.group().decode('utf-8', 'replace')[:50]}..."
 
-    if not has_youtube_cookies:
+    # Check for YouTube/Google cookies
+    domains = COOKIE_LINE_DOMAIN.findall(content)
+    if not any(b'youtube.com' in domain or b'google.com' in domain for domain in domains):
         return False, "No YouTube/Google cookies found"
 
+    valid_lines = len(domains)
     if valid_lines < 3:
         return False, "Too few valid cookies"
 
     return True, f"Valid cookies file with {valid_lines} cookies"
 
+# Session cookies Google only sets for a signed-in account
+LOGIN_COOKIE_NAMES = frozenset({'SID', '__Secure-1PSID', '__Secure-3PSID', 'LOGIN_INFO'})
+
+# Probes share one keep-alive connection pool to YouTube; the session itself never stores cookies,
+# so each probe sends exactly the jar it was given
+cookies_http = requests.Session()
+cookies_http.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+cookies_http.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+cookies_http.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+# The startup probe opens a connection in the process gunicorn forks workers from; each child drops its
+# inherited copy and lazily opens its own, so workers never share one TLS stream
+os.register_at_fork(after_in_child=cookies_http.close)
+
 def test_cookies_validity(cookies_path):
     """Test if cookies work by making a simple request"""
     try:
-        import http.cookiejar
-        import urllib.request
-
         # Load cookies
         jar = http.cookiejar.MozillaCookieJar(cookies_path)
         jar.load(ignore_discard=True, ignore_expires=True)
 
-        # Test request to YouTube
-        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
-        opener.addheaders = [('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')]
-
-        response = opener.open('https://www.youtube.com', timeout=10)
+        # Test request to YouTube; only reachability matters, so skip downloading the page body.
+        # Follow redirects (e.g. the EU consent page) like a GET would; requests doesn't for HEAD by default.
+        response = cookies_http.head('https://www.youtube.com', cookies=jar, timeout=10, allow_redirects=True)
 
-        if response.getcode() == 200:
-            content = response.read().decode('utf-8')
+        if response.status_code == 200:
             # Check for logged-in indicators
-            if 'avatar' in content.lower() or 'channel' in content.lower():
+            if any(cookie.name in LOGIN_COOKIE_NAMES for cookie in jar):
                 return True, "Cookies appear to be from logged-in session"
             else:
                 return True, "Cookies work but may not be logged in"
 
-        return False, f"HTTP {response.getcode()}"
+        return False, f"HTTP {response.status_code}"
 
     except Exception as e:
         return False, str(e)
 
+def get_cookies_validity(cookies_path):
+    """Return test_cookies_validity's result, probing again only when the file changed or the TTL expired"""
+    try:
+        file_stat = os.stat(cookies_path)
+    except OSError as e:
+        return False, str(e)
+
+    key = (file_stat.st_mtime_ns, file_stat.st_size)
+    with cookies_test_cache_lock:
+        cached = cookies_test_cache.get(cookies_path)
+    if cached and cached[0] == key and time.monotonic() < cached[1]:
+        return cached[2]
+
+    result = test_cookies_validity(cookies_path)
+    with cookies_test_cache_lock:
+        cookies_test_cache[cookies_path] = (key, time.monotonic() + COOKIES_TEST_TTL, result)
+    return result
+
+def list_cookie_files():
+    """Return (path, stat) for every uploaded cookies file, rescanning only when the folder changed"""
+    key = os.stat(COOKIES_FOLDER).st_mtime_ns
+    with cookie_files_cache_lock:
+        if cookie_files_cache['key'] != key:
+            with os.scandir(COOKIES_FOLDER) as entries:
+                cookie_files_cache['files'] = [(entry.path, entry.stat()) for entry in entries
+                                               if entry.name.endswith('.txt') and entry.is_file()]
+            cookie_files_cache['key'] = key
+        return cookie_files_cache['files']
+
 def get_best_cookies():
     """Find the best working cookies from available options"""
     cookies_options = []
@@ -145,10 +301,20 @@ def get_best_cookies():
     if env_cookies:
         env_path = os.path.join(TEMP_BASE, 'env_cookies.txt')
         try:
-            with open(env_path, 'w') as f:
-                f.write(env_cookies)
-
-            is_working, status = test_cookies_validity(env_path)
+            # Rewrite only when the content differs, so the file (and its cached probe result) stays put
+            try:
+                with open(env_path) as f:
+                    current = f.read()
+            except OSError:
+                current = None
+            if current != env_cookies:
+                write_file_atomic(env_path, env_cookies.encode('utf-8'))
+
+            is_working, status = get_cookies_validity(env_path)
+            if is_working:
+                # Working env cookies always rank first, so the uploaded files need not be probed at all
+                logging.info("Using cookies from: Environment Variable")
+                return env_path
             cookies_options.append({
                 'path': env_path,
                 'source': 'Environment Variable',
@@ -160,11 +326,10 @@ def get_best_cookies():
             logging.error(f"Failed to create env cookies file: {e}")
 
     # Option 2: User uploaded cookies
-    cookie_files = glob.glob(os.path.join(COOKIES_FOLDER, '*.txt'))
-    for cookie_file in cookie_files:
+    for cookie_file, file_stat in list_cookie_files():
         try:
-            age_hours = (datetime.now() - datetime.fromtimestamp(os.path.getctime(cookie_file))).total_seconds() / 3600
-            is_working, status = test_cookies_validity(cookie_file)
+            age_hours = (time.time() - file_stat.st_ctime) / 3600
+            is_working, status = get_cookies_validity(cookie_file)
 
             cookies_options.append({
                 'path': cookie_file,
@@ -200,6 +365,22 @@ def get_best_cookies():
     logging.warning("No cookies available")
     return None
 
+spotdl_lock = threading.Lock()
+
+def get_spotdl():
+    """Return the process-wide Spotdl client, authenticating with Spotify only once"""
+    # spotdl refuses a second client per process, so concurrent first requests must not race here
+    with spotdl_lock:
+        return _create_spotdl()
+
+@functools.lru_cache(maxsize=1)
+def _create_spotdl():
+    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
+        raise ValueError("Spotify API credentials are not configured.")
+
+    logging.info("Initializing Spotdl client")
+    return Spotdl(client_id=SPOTIFY_CLIENT_ID, client_secret=SPOTIFY_CLIENT_SECRET, headless=True)
+
 def setup_youtube_cookies():
     """Setup YouTube cookies using the best available option"""
     best_cookies = get_best_cookies()
@@ -210,54 +391,419 @@ def setup_youtube_cookies():
     else:
         return False
 
+# yt-dlp options shared by every Downloader; spotdl shell-splits the string, so it is quoted once here
+YT_DLP_BASE_ARGS = shlex.join([
+    "--socket-timeout", "30", "--retries", "3", "--fragment-retries", "3",
+    "--retry-sleep", "1", "--no-abort-on-error", "--ignore-errors",
+    # Fetch fragmented streams in parallel and large ones in ranged chunks over the kept-alive connection
+    "--concurrent-fragments", "4", "--http-chunk-size", "10M",
+    "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+])
+
+# At most one refresh runs at a time; requests arriving meanwhile collapse into a single follow-up pass
+cookies_refresh = {'running': False, 'pending': False}
+cookies_refresh_lock = threading.Lock()
+
+def refresh_youtube_cookies():
+    """Re-pick the best cookies on a background thread, so request handlers don't wait on YouTube probes"""
+    with cookies_refresh_lock:
+        if cookies_refresh['running']:
+            cookies_refresh['pending'] = True
+            return
+        cookies_refresh['running'] = True
+    threading.Thread(target=run_cookies_refresh, name='cookies-refresh', daemon=True).start()
+
+def run_cookies_refresh():
+    """Run setup_youtube_cookies until no further refresh was requested while it ran"""
+    while True:
+        try:
+            setup_youtube_cookies()
+        except Exception as e:
+            logging.error(f"Cookies refresh failed: {e}")
+        with cookies_refresh_lock:
+            if not cookies_refresh['pending']:
+                cookies_refresh['running'] = False
+                return
+            cookies_refresh['pending'] = False
+
+def close_downloader(downloader):
+    """Stop a Downloader's event loop and the executor threads behind it"""
+    downloader.loop.run_until_complete(downloader.loop.shutdown_default_executor())
+    downloader.loop.close()
+
+def get_downloader(output_format, proxy_url, best_cookies):
+    """Return a Downloader for these settings, reusing the calling thread's instance across songs and jobs"""
+    # A Downloader drives its own event loop, so instances are shared between songs but never between threads
+    downloaders = getattr(thread_downloaders, 'by_settings', None)
+    if downloaders is None:
+        downloaders = thread_downloaders.by_settings = {}
+
+    key = (proxy_url, best_cookies)
+    downloader = downloaders.pop(key, None)
+    if downloader is None:
+        if len(downloaders) >= DOWNLOADERS_PER_THREAD:
+            close_downloader(downloaders.pop(next(iter(downloaders))))  # Least recently used
+
+        downloader_settings = {"simple_tui": True, "output": output_format}
+        yt_dlp_args = [YT_DLP_BASE_ARGS]
+        if proxy_url:
+            yt_dlp_args.insert(0, shlex.join(["--proxy", proxy_url, "--source-address", "0.0.0.0"]))
+        if best_cookies:
+            yt_dlp_args.append(shlex.join(["--cookies", best_cookies]))
+
+        downloader_settings["yt_dlp_args"] = " ".join(yt_dlp_args)
+        downloader = Downloader(settings=downloader_settings)
+
+    downloaders[key] = downloader  # Re-insert as most recently used
+
+    # The output template is read per download, and this thread is the only user of the instance
+    downloader.settings["output"] = output_format
+    return downloader
+
+def download_song_with_fallback(song, output_format, proxy_url, best_cookies):
+    """Download a single song, trying the proxy first and falling back to a direct connection"""
+    path = None
+
+    # Attempt 1: With proxy (if available)
+    if proxy_url:
+        try:
+            logging.info(f"Attempting to download '{song.name}' with proxy...")
+            _, path = get_downloader(output_format, proxy_url, best_cookies).download_song(song)
+        except AudioProviderError as e:
+            logging.error(f"AudioProviderError with proxy: {e}")
+            path = None
+
+    # Attempt 2: Without proxy (if first attempt failed or no proxy was set)
+    if not path:
+        try:
+            if proxy_url:
+                logging.warning(f"Download with proxy failed for '{song.name}'. Retrying without proxy...")
+            else:
+                logging.info(f"Attempting to download '{song.name}' (no proxy)...")
+
+            _, path = get_downloader(output_format, None, best_cookies).download_song(song)
+        except AudioProviderError as e:
+            logging.error(f"AudioProviderError without proxy: {e}")
+            path = None
+
+    return path
+
+def find_songs(url):
+    """Resolve a Spotify URL to songs, skipping full query parsing for single tracks"""
+    spotify_client = get_spotdl()
+    if 'open.spotify.com/track/' in url:
+        return [Song.from_url(url)]
+    return spotify_client.search([url])
+
+def run_download_job(session_id, url, user_name):
+    """Download a URL into its session folder, recording progress in the job's status file"""
+    user_download_folder = os.path.join(DOWNLOAD_FOLDER, user_name)
+    session_folder = os.path.join(user_download_folder, session_id)
+
+    try:
+        # From here on the job is kept alive by its status updates rather than its queue slot
+        write_job_status(session_id, state='running')
+        logging.info(f"Processing URL for user '{user_name}': {url} in session {session_id}")
+        songs = find_songs(url)
+
+        if not songs:
+            write_job_status(session_id, state='failed', category='warning',
+                             message='WARNING: Could not find any songs for the given URL.')
+            return
+
+        # Only create the session folder once there is something to download into it
+        os.makedirs(session_folder, exist_ok=True)
+        write_job_status(session_id, total=len(songs))
+
+        is_playlist = len(songs) > 1
+        download_path = None # Initialize download_path
+        if is_playlist:
+            playlist_name = songs[0].album or songs[0].artist or "Playlist"
+            sanitized_playlist_name = PLAYLIST_NAME_UNSAFE.sub('', playlist_name).rstrip()
+            download_path = os.path.join(session_folder, sanitized_playlist_name)
+            os.makedirs(download_path, exist_ok=True)
+            output_format = os.path.join(download_path, "{title} - {artist}.{output-ext}")
+        else:
+            output_format = os.path.join(session_folder, "{title} - {artist}.{output-ext}")
+
+        # --- DOWNLOAD LOGIC WITH PROXY FALLBACK ---
+        best_cookies = get_best_cookies()
+
+        futures = [song_downloads.submit(download_song_with_fallback, song, output_format, PROXY_URL, best_cookies) for song in songs]
+        paths = []
+        try:
+            for completed, future in enumerate(as_completed(futures), 1):
+                path = future.result()
+                if path:
+                    paths.append(path)
+                write_job_status(session_id, completed=completed)
+        except Exception:
+            # Don't leave this job's queued songs occupying the shared pool
+            for future in futures:
+                future.cancel()
+            raise
+
+        # --- END OF DOWNLOAD LOGIC ---
+
+        # The downloader reports the path of every file it actually wrote
+        if paths:
+            if is_playlist:
+                zip_filepath = os.path.join(session_folder, f"{sanitized_playlist_name}.zip")
+                zip_files(paths, zip_filepath)
+                final_filename = os.path.basename(zip_filepath)
+                shutil.rmtree(download_path)
+            else:
+                final_filename = os.path.basename(paths[0])
+
+            logging.info(f"Successfully prepared '{final_filename}' for user '{user_name}'")
+            invalidate_downloads_cache()
+            write_job_status(session_id, state='done', filename=final_filename)
+        else:
+            write_job_status(session_id, state='failed', category='danger',
+                             message='ERROR: Download failed. No audio file was created. The URL might be invalid or protected. Try uploading fresh cookies.')
+            shutil.rmtree(session_folder, ignore_errors=True)
+
+    except Exception as e:
+        logging.error(f"An error occurred for user '{user_name}': {e}", exc_info=True)
+        write_job_status(session_id, state='failed', category='danger', message=f'FATAL ERROR: {e}')
+        shutil.rmtree(session_folder, ignore_errors=True)
+
+def zip_files(paths, zip_path):
+    """Bundle files into a zip without recompressing the already-compressed audio inside"""
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        # Songs with the same title and artist resolve to the same file; store it once
+        for file_path in dict.fromkeys(paths):
+            zf.write(file_path, os.path.basename(file_path))
+
+def write_job_status(session_id, **fields):
+    """Merge fields into a download job's status file, replacing it atomically"""
+    status_path = os.path.join(JOBS_FOLDER, f"{session_id}.json")
+    with job_status_lock:
+        status = load_job_status(session_id) or {}
+        status.update(fields, updated=time.time())
+        tmp_path = f"{status_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, status_path)
+
+def load_job_status(session_id):
+    """Return a download job's status file as written, or None if there is none"""
+    try:
+        with open(os.path.join(JOBS_FOLDER, f"{session_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_process_alive(pid):
+    """Return whether a process with this pid still exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def read_job_status(session_id):
+    """Return a download job's status, or None if it is unknown or expired; abandoned jobs read as failed"""
+    status = load_job_status(session_id)
+    if not status:
+        return status
+
+    if status.get('state') == 'running':
+        abandoned = time.time() - status.get('updated', 0) > JOB_STALE_AFTER
+    elif status.get('state') == 'queued':
+        abandoned = not is_process_alive(status.get('worker_pid', 0))
+    else:
+        abandoned = False
+
+    if abandoned:
+        status.update(state='failed', category='danger',
+                      message='ERROR: The download job stopped responding. Please try again.')
+    return status
+
+def scan_downloads():
+    """Walk DOWNLOAD_FOLDER and group downloaded files by user, newest first"""
+    all_downloads = []
+    with os.scandir(DOWNLOAD_FOLDER) as user_entries:
+        user_dirs = sorted((e for e in user_entries if e.is_dir()), key=lambda e: e.name)
+
+    for user_entry in user_dirs:
+        user_files = []
+        with os.scandir(user_entry.path) as session_entries:
+            for session_entry in session_entries:
+                if not session_entry.is_dir():
+                    continue
+                creation_time = datetime.fromtimestamp(session_entry.stat().st_ctime)
+                with os.scandir(session_entry.path) as file_entries:
+                    for file_entry in file_entries:
+                        user_files.append({
+                            'user_name': user_entry.name,
+                            'session_id': session_entry.name,
+                            'filename': file_entry.name,
+                            'timestamp': creation_time,
+                            # Resolved once per scan instead of on every render of the cached listing
+                            'url': url_for('download_file', user_name=user_entry.name,
+                                           session_id=session_entry.name, filename=file_entry.name)
+                        })
+        user_files.sort(key=lambda x: x['timestamp'], reverse=True)
+        if user_files:
+            all_downloads.append({'user': user_entry.name, 'files': user_files})
+
+    return all_downloads
+
+def get_downloads():
+    """Return the cached download listing, rescanning only when it is stale"""
+    key = os.stat(DOWNLOAD_FOLDER).st_mtime_ns
+    with downloads_cache_lock:
+        if downloads_cache['key'] != key or time.monotonic() >= downloads_cache['expires']:
+            downloads_cache['data'] = scan_downloads()
+            downloads_cache['key'] = key
+            downloads_cache['expires'] = time.monotonic() + DOWNLOADS_CACHE_TTL
+        return downloads_cache['data']
+
+def render_downloads_page():
+    """Render the archive page as bytes plus its ETag, reusing the last render while the listing is unchanged"""
+    all_downloads = get_downloads()
+    page = downloads_cache['page']
+    if page is None or page[0] is not all_downloads:
+        body = render_template('downloads.html', downloads_by_user=all_downloads).encode('utf-8')
+        page = (all_downloads, body, hashlib.sha1(body).hexdigest())
+        downloads_cache['page'] = page
+    return page[1], page[2]
+
+def invalidate_downloads_cache():
+    """Force the next archive listing to rescan the downloads folder"""
+    with downloads_cache_lock:
+        downloads_cache['expires'] = 0
+
+def convert_audio(input_path, output_path, target_format):
+    """Convert an audio file in a single ffmpeg pass, falling back to pydub if ffmpeg rejects it"""
+    try:
+        subprocess.run(
+            [FFMPEG, *FFMPEG_QUIET_ARGS, "-y", "-i", input_path, "-vn", "-f", target_format, output_path],
+            check=True, stdin=subprocess.DEVNULL, capture_output=True
+        )
+    except subprocess.CalledProcessError as e:
+        logging.warning(f"ffmpeg conversion failed, retrying with pydub: {e.stderr.decode(errors='replace')[-500:]}")
+        audio = AudioSegment.from_file(input_path, parameters=FFMPEG_QUIET_ARGS)
+        audio.export(output_path, format=target_format, parameters=FFMPEG_QUIET_ARGS)
+
+def convert_upload(file, output_path, target_format):
+    """Convert an uploaded file straight from the file Werkzeug spooled it to"""
+    file.stream.flush()
+    convert_audio(file.stream.name, output_path, target_format)
+
+def send_stored_file(directory, filename):
+    """Send a stored file as an attachment, handing the transfer to nginx when it fronts the app"""
+    if not X_ACCEL_REDIRECT_PREFIX:
+        return send_from_directory(directory, filename, as_attachment=True)
+
+    # Werkzeug resolves and validates the path and builds the headers; nginx then streams the body itself.
+    # Conditional and Range requests are left to nginx too, so the response is always the full-file 200 it replaces.
+    response = werkzeug.utils.send_from_directory(directory, filename, request.environ, as_attachment=True,
+                                                  use_x_sendfile=True, conditional=False, etag=False,
+                                                  response_class=app.response_class)
+    file_path = response.headers.pop('X-Sendfile', None)
+    if file_path:
+        response.headers['X-Accel-Redirect'] = urllib.parse.quote(
+            f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{os.path.relpath(file_path, TEMP_BASE)}")
+    return response
+
 # --- Railway-optimized cleanup scheduler ---
+RM_BINARY = shutil.which('rm')
+RM_BATCH_SIZE = 1000  # Paths per `rm` invocation, well under ARG_MAX
+
+def remove_folders(paths):
+    """Delete folder trees, batching them into as few `rm -rf` processes as possible"""
+    if RM_BINARY is None:
+        for path in paths:
+            try:
+                shutil.rmtree(path)
+                logging.info(f"Deleted old folder: {path}")
+            except OSError as e:
+                logging.warning(f"Could not delete {path}: {e}")
+        return
+
+    for i in range(0, len(paths), RM_BATCH_SIZE):
+        batch = paths[i:i + RM_BATCH_SIZE]
+        result = subprocess.run([RM_BINARY, "-rf", "--", *batch], stdin=subprocess.DEVNULL, capture_output=True)
+        if result.returncode != 0:
+            logging.warning(f"Could not delete some old folders: {result.stderr.decode(errors='replace').strip()}")
+        for path in batch:
+            if not os.path.exists(path):
+                logging.info(f"Deleted old folder: {path}")
+
 def cleanup_old_files():
     logging.info("Running scheduled cleanup of old files and folders...")
     now = datetime.now()
-    cutoff = now - timedelta(hours=2)  # More aggressive cleanup for Railway's limited storage
+    cutoff_ts = (now - timedelta(hours=2)).timestamp()  # More aggressive cleanup for Railway's limited storage
+    old_folders = []
 
-    for base_folder in [DOWNLOAD_FOLDER, CONVERTER_UPLOADS, CONVERTER_OUTPUT]:
+    for base_folder in [DOWNLOAD_FOLDER, CONVERTER_UPLOADS, CONVERTER_OUTPUT, JOBS_FOLDER]:
         try:
             if not os.path.exists(base_folder):
                 continue
 
-            for item_name in os.listdir(base_folder):
-                item_path = os.path.join(base_folder, item_name)
-                try:
-                    if datetime.fromtimestamp(os.path.getctime(item_path)) < cutoff:
-                        if os.path.isdir(item_path):
-                            shutil.rmtree(item_path)
-                            logging.info(f"Deleted old folder: {item_path}")
+            with os.scandir(base_folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.stat(follow_symlinks=False).st_ctime >= cutoff_ts:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            old_folders.append(entry.path)
                         else:
-                            os.remove(item_path)
-                            logging.info(f"Deleted old file: {item_path}")
-                except (OSError, FileNotFoundError) as e:
-                    logging.warning(f"Could not delete {item_path}: {e}")
+                            os.remove(entry.path)
+                            logging.info(f"Deleted old file: {entry.path}")
+                    except (OSError, FileNotFoundError) as e:
+                        logging.warning(f"Could not delete {entry.path}: {e}")
         except Exception as e:
             logging.error(f"Error during cleanup of {base_folder}: {e}")
 
+    remove_folders(old_folders)
+    invalidate_downloads_cache()
+
     # Clean old cookies (keep for 7 days)
-    cookie_cutoff = now - timedelta(days=7)
+    cookie_cutoff_ts = (now - timedelta(days=7)).timestamp()
     try:
-        for cookie_file in glob.glob(os.path.join(COOKIES_FOLDER, '*.txt')):
-            if datetime.fromtimestamp(os.path.getctime(cookie_file)) < cookie_cutoff:
-                os.remove(cookie_file)
-                logging.info(f"Deleted old cookies: {cookie_file}")
+        with os.scandir(COOKIES_FOLDER) as entries:
+            for entry in entries:
+                if entry.name.endswith('.txt') and entry.stat(follow_symlinks=False).st_ctime < cookie_cutoff_ts:
+                    os.remove(entry.path)
+                    logging.info(f"Deleted old cookies: {entry.path}")
     except Exception as e:
         logging.error(f"Error cleaning cookies: {e}")
 
 # More frequent cleanup for Railway
 scheduler = BackgroundScheduler(daemon=True)
-scheduler.add_job(cleanup_old_files, 'interval', minutes=30)  # Every 30 minutes
+# Every 30 minutes; a sweep still running on a slow disk is never joined by a second one
+scheduler.add_job(cleanup_old_files, 'interval', minutes=30, max_instances=1, coalesce=True, misfire_grace_time=600)
 scheduler.start()
 
-# Setup cookies on startup
+# Setup cookies on startup; this stays synchronous because gunicorn forks the workers from this process
+# right after import, and a probe still in flight would leave its locks held in every child
 setup_youtube_cookies()
 
 # --- Flask Routes ---
 @app.route('/')
 def index():
-    return render_template('index.html')
+    job_id = request.args.get('job')
+    if not job_id:
+        return render_template('index.html')
+
+    job_id = sanitize_name(job_id)
+    status = read_job_status(job_id)
+    if status is None:
+        flash('ERROR: Unknown or expired download job.', 'danger')
+        return render_template('index.html')
+
+    if status['state'] == 'done':
+        return render_template('index.html', download_link=True, user_name=status['user_name'], session_id=job_id, filename=status['filename'])
+    if status['state'] == 'failed':
+        flash(status['message'], status['category'])
+        return render_template('index.html')
+
+    return render_template('index.html', job_id=job_id, job=status)
 
 @app.route('/cookies')
 def cookies_page():
@@ -265,10 +811,9 @@ def cookies_page():
     cookie_files = []
 
     try:
-        for cookie_file in glob.glob(os.path.join(COOKIES_FOLDER, '*.txt')):
-            file_stat = os.stat(cookie_file)
+        for cookie_file, file_stat in list_cookie_files():
             age = datetime.now() - datetime.fromtimestamp(file_stat.st_ctime)
-            is_working, status = test_cookies_validity(cookie_file)
+            is_working, status = get_cookies_validity(cookie_file)
 
             cookie_files.append({
                 'filename': os.path.basename(cookie_file),
@@ -289,6 +834,11 @@ def cookies_page():
 @app.route('/cookies/upload', methods=['POST'])
 def upload_cookies():
     """Handle cookies file upload"""
+    # Refuse oversized bodies before touching request.files, which would spool the whole upload to disk
+    if request.content_length and request.content_length > MAX_COOKIES_UPLOAD_SIZE:
+        flash('Invalid cookies file: File is larger than 1 MB', 'danger')
+        return redirect(url_for('cookies_page'))
+
     if 'cookies_file' not in request.files:
         flash('No file selected', 'danger')
         return redirect(url_for('cookies_page'))
@@ -301,8 +851,12 @@ def upload_cookies():
         return redirect(url_for('cookies_page'))
 
     try:
-        # Read and validate file content
-        content = file.read().decode('utf-8')
+        # Read and validate file content; bodies without a Content-Length are still capped here
+        content = file.stream.read(MAX_COOKIES_FILE_SIZE + 1)
+        if len(content) > MAX_COOKIES_FILE_SIZE:
+            flash('Invalid cookies file: File is larger than 1 MB', 'danger')
+            return redirect(url_for('cookies_page'))
+
         is_valid, message = validate_cookies_file(content)
 
         if not is_valid:
@@ -314,18 +868,17 @@ def upload_cookies():
         filename = f"{user_name}_{timestamp}_cookies.txt"
         file_path = os.path.join(COOKIES_FOLDER, filename)
 
-        with open(file_path, 'w') as f:
-            f.write(content)
+        write_file_atomic(file_path, content)
 
         # Test the cookies
-        is_working, status = test_cookies_validity(file_path)
+        is_working, status = get_cookies_validity(file_path)
         status_msg = "✅ Working" if is_working else f"⚠️ {status}"
 
         flash(f'Cookies uploaded successfully! Status: {status_msg}', 'success' if is_working else 'warning')
         logging.info(f"New cookies uploaded by {user_name}: {filename} - {status}")
 
         # Refresh best cookies
-        setup_youtube_cookies()
+        refresh_youtube_cookies()
 
     except Exception as e:
         logging.error(f"Cookie upload failed: {e}")
@@ -340,11 +893,13 @@ def delete_cookies(filename):
         file_path = os.path.join(COOKIES_FOLDER, filename)
         if os.path.exists(file_path):
             os.remove(file_path)
+            with cookies_test_cache_lock:
+                cookies_test_cache.pop(file_path, None)
             flash(f'Deleted {filename}', 'success')
             logging.info(f"Deleted cookies file: {filename}")
 
             # Refresh best cookies
-            setup_youtube_cookies()
+            refresh_youtube_cookies()
         else:
             flash('File not found', 'danger')
     except Exception as e:
@@ -355,7 +910,7 @@ def delete_cookies(filename):
 
 @app.route('/process', methods=['POST'])
 def process_download():
-    """Process download with automatic cookie selection and proxy fallback."""
+    """Queue a download job and send the user to its progress page."""
     url = request.form.get('url')
     user_name = sanitize_name(request.form.get('name'))
 
@@ -363,118 +918,19 @@ def process_download():
         flash('ERROR: No URL provided.', 'danger')
         return redirect(url_for('index'))
 
-    session_id = str(uuid.uuid4())
-    user_download_folder = os.path.join(DOWNLOAD_FOLDER, user_name)
-    session_folder = os.path.join(user_download_folder, session_id)
-    os.makedirs(session_folder, exist_ok=True)
-
-    try:
-        logging.info(f"Processing URL for user '{user_name}': {url} in session {session_id}")
-        client_id = os.environ.get('SPOTIFY_CLIENT_ID')
-        client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET')
+    session_id = secrets.token_hex(8)
+    write_job_status(session_id, state='queued', user_name=user_name, worker_pid=os.getpid(), completed=0, total=0)
+    download_jobs.submit(run_download_job, session_id, url, user_name)
 
-        if not client_id or not client_secret:
-            raise ValueError("Spotify API credentials are not configured.")
+    return redirect(url_for('index', job=session_id))
 
-        spotify_client = Spotdl(client_id=client_id, client_secret=client_secret, headless=True)
-        songs = spotify_client.search([url])
-
-        if not songs:
-            flash('WARNING: Could not find any songs for the given URL.', 'warning')
-            shutil.rmtree(session_folder)
-            return redirect(url_for('index'))
-
-        is_playlist = len(songs) > 1
-        download_path = None # Initialize download_path
-        if is_playlist:
-            playlist_name = songs[0].album or songs[0].artist or "Playlist"
-            sanitized_playlist_name = "".join(c for c in playlist_name if c.isalnum() or c in (' ', '-')).rstrip()
-            download_path = os.path.join(session_folder, sanitized_playlist_name)
-            os.makedirs(download_path, exist_ok=True)
-            output_format = os.path.join(download_path, "{title} - {artist}.{output-ext}")
-        else:
-            output_format = os.path.join(session_folder, "{title} - {artist}.{output-ext}")
-
-        # --- DOWNLOAD LOGIC WITH PROXY FALLBACK ---
-        proxy_url = os.environ.get('PROXY_URL')
-        best_cookies = get_best_cookies()
-
-        for song in songs:
-            success = False
-
-            # Attempt 1: With proxy (if available)
-            if proxy_url:
-                try:
-                    logging.info(f"Attempting to download '{song.name}' with proxy...")
-                    downloader_settings = {"simple_tui": True, "output": output_format}
-                    yt_dlp_args = [
-                        "--proxy", proxy_url, "--source-address", "0.0.0.0",
-                        "--socket-timeout", "30", "--retries", "3", "--fragment-retries", "3",
-                        "--retry-sleep", "1", "--no-abort-on-error", "--ignore-errors",
-                        "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                    ]
-                    if best_cookies:
-                        yt_dlp_args.extend(["--cookies", best_cookies])
-                    
-                    downloader_settings["yt_dlp_args"] = " ".join(yt_dlp_args)
-                    downloader = Downloader(settings=downloader_settings)
-                    success, _ = downloader.download_song(song)
-                except AudioProviderError as e:
-                    logging.error(f"AudioProviderError with proxy: {e}")
-                    success = False
-
-            # Attempt 2: Without proxy (if first attempt failed or no proxy was set)
-            if not success:
-                try:
-                    if proxy_url:
-                        logging.warning(f"Download with proxy failed for '{song.name}'. Retrying without proxy...")
-                    else:
-                        logging.info(f"Attempting to download '{song.name}' (no proxy)...")
-
-                    downloader_settings = {"simple_tui": True, "output": output_format}
-                    yt_dlp_args = [
-                        "--socket-timeout", "30", "--retries", "3", "--fragment-retries", "3",
-                        "--retry-sleep", "1", "--no-abort-on-error", "--ignore-errors",
-                        "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                    ]
-                    if best_cookies:
-                        yt_dlp_args.extend(["--cookies", best_cookies])
-
-                    downloader_settings["yt_dlp_args"] = " ".join(yt_dlp_args)
-                    downloader = Downloader(settings=downloader_settings)
-                    success, _ = downloader.download_song(song)
-                except AudioProviderError as e:
-                    logging.error(f"AudioProviderError without proxy: {e}")
-                    success = False
-        
-        # --- END OF DOWNLOAD LOGIC ---
-
-        # Robust check: verify that files were actually created on disk.
-        actual_output_dir = download_path if is_playlist else session_folder
-        if os.path.exists(actual_output_dir) and os.listdir(actual_output_dir):
-            if is_playlist:
-                zip_filename_base = f"{sanitized_playlist_name}"
-                zip_filepath = shutil.make_archive(os.path.join(session_folder, zip_filename_base), 'zip', download_path)
-                final_filename = os.path.basename(zip_filepath)
-                shutil.rmtree(download_path)
-            else:
-                # Now this is safe because we've confirmed the directory is not empty.
-                final_filename = os.listdir(session_folder)[0]
-            
-            logging.info(f"Successfully prepared '{final_filename}' for user '{user_name}'")
-            return render_template('index.html', download_link=True, user_name=user_name, session_id=session_id, filename=final_filename)
-        else:
-            flash('ERROR: Download failed. No audio file was created. The URL might be invalid or protected. Try uploading fresh cookies.', 'danger')
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-
-    except Exception as e:
-        logging.error(f"An error occurred for user '{user_name}': {e}", exc_info=True)
-        flash(f'FATAL ERROR: {e}', 'danger')
-        if os.path.exists(session_folder):
-            shutil.rmtree(session_folder)
-
-    return redirect(url_for('index'))
+@app.route('/status/<session_id>')
+def job_status(session_id):
+    """Report the progress of a background download job."""
+    status = read_job_status(sanitize_name(session_id))
+    if status is None:
+        return jsonify({'state': 'unknown'}), 404
+    return jsonify(status)
 
 @app.route('/converter', methods=['GET', 'POST'])
 def converter_page():
@@ -496,17 +952,12 @@ def converter_page():
             return redirect(request.url)
 
         if file:
-            temp_id = str(uuid.uuid4())
-            upload_path = os.path.join(CONVERTER_UPLOADS, temp_id)
-            
             try:
-                file.save(upload_path)
                 logging.info(f"Converting {file.filename} to {target_format}")
-                audio = AudioSegment.from_file(upload_path)
-                
+
                 output_filename = f"{os.path.splitext(file.filename)[0]}.{target_format}"
                 output_path = os.path.join(CONVERTER_OUTPUT, output_filename)
-                audio.export(output_path, format=target_format)
+                convert_upload(file, output_path, target_format)
 
                 return render_template('converter.html', conversion_complete=True, filename=output_filename)
 
@@ -514,55 +965,42 @@ def converter_page():
                 logging.error(f"Conversion failed: {e}", exc_info=True)
                 flash(f"ERROR: Conversion failed. The uploaded file may not be a valid audio format. Details: {e}", 'danger')
                 return redirect(request.url)
-            finally:
-                if os.path.exists(upload_path):
-                    os.remove(upload_path)
 
     return render_template('converter.html')
 
 @app.route('/download_converted/<filename>')
 def download_converted_file(filename):
     logging.info(f"Serving converted file: {filename}")
-    return send_from_directory(CONVERTER_OUTPUT, filename, as_attachment=True)
+    return send_stored_file(CONVERTER_OUTPUT, filename)
 
 @app.route('/downloads')
 def downloads_page():
-    all_downloads = []
     try:
-        for user_name in sorted(os.listdir(DOWNLOAD_FOLDER)):
-            user_folder_path = os.path.join(DOWNLOAD_FOLDER, user_name)
-            if os.path.isdir(user_folder_path):
-                user_files = []
-                for session_id in os.listdir(user_folder_path):
-                    session_folder_path = os.path.join(user_folder_path, session_id)
-                    if os.path.isdir(session_folder_path):
-                        for filename in os.listdir(session_folder_path):
-                            creation_time = datetime.fromtimestamp(os.path.getctime(session_folder_path))
-                            user_files.append({
-                                'user_name': user_name,
-                                'session_id': session_id,
-                                'filename': filename,
-                                'timestamp': creation_time
-                            })
-                user_files.sort(key=lambda x: x['timestamp'], reverse=True)
-                if user_files:
-                    all_downloads.append({'user': user_name, 'files': user_files})
+        body, etag = render_downloads_page()
+        response = app.response_class(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # Always revalidate; unchanged listings cost a 304
+        return response.make_conditional(request)
     except Exception as e:
         logging.error(f"Error reading download directory: {e}")
         flash("Could not load download history.", "danger")
 
-    return render_template('downloads.html', downloads_by_user=all_downloads)
+    return render_template('downloads.html', downloads_by_user=[])
 
 @app.route('/download/<user_name>/<session_id>/<filename>')
 def download_file(user_name, session_id, filename):
     directory = os.path.join(DOWNLOAD_FOLDER, user_name, session_id)
     logging.info(f"Serving file: {filename} for user: {user_name}")
-    return send_from_directory(directory, filename, as_attachment=True)
+    return send_stored_file(directory, filename)
 
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
+# Compile every template up front; with gunicorn --preload the workers inherit them already compiled
+for template_name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(template_name)
+
 if __name__ == '__main__':
     # Railway provides PORT environment variable
     port = int(os.environ.get('PORT', 5000))